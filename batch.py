@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import math
+import shlex
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+import database as db
+
+# Format skryptu - jedno polecenie na linię, pierwszy argument to zawsze login
+# użytkownika (sesja). Linie zaczynające się od '#' i puste są pomijane.
+#
+#   tekst:  add_to_cart alice 1 2
+#   JSONL:  {"op": "add_to_cart", "user": "alice", "card_id": 1, "qty": 2}
+#
+# Polecenia tej samej sesji wykonuje zawsze ten sam worker (w kolejności
+# ze skryptu), różne sesje mogą iść równolegle. Przy workers > 1 polecenia
+# RÓŻNYCH użytkowników nie są względem siebie uporządkowane - kroki, które
+# muszą poprzedzać resztę (zmiany admina, rejestracje), trzeba wykonać
+# osobnym skryptem albo z workers = 1.
+
+INT_PARAMS = {"card_id", "qty", "price_cents", "stock_qty", "active"}
+
+
+@dataclass(frozen=True)
+class Command:
+    line_no: int
+    op: str
+    user: str
+    params: dict
+
+
+@dataclass(frozen=True)
+class CommandResult:
+    command: Command
+    ok: bool
+    latency_s: float
+    output: str
+
+
+class Session:
+    def __init__(self) -> None:
+        self.users: dict[str, db.User] = {}
+
+    def require_user(self, username: str) -> db.User:
+        user = self.users.get(username)
+        if user is None:
+            raise ValueError(f"Użytkownik {username} nie jest zalogowany")
+        return user
+
+    def require_admin(self, username: str) -> db.User:
+        user = self.require_user(username)
+        if user.role != "admin":
+            raise ValueError("Brak uprawnień administratora")
+        return user
+
+
+def op_register(s: Session, user: str, password: str) -> str:
+    return f"id={db.create_user(user, password, role='user')}"
+
+
+def op_login(s: Session, user: str, password: str) -> str:
+    found = db.authenticate(user, password)
+    if not found:
+        raise ValueError("Błędny login lub hasło")
+    s.users[user] = found
+    return f"role={found.role}"
+
+
+def op_add_to_cart(s: Session, user: str, card_id: int, qty: int) -> str:
+    db.add_to_cart(s.require_user(user).id, card_id, qty)
+    return "ok"
+
+
+def op_clear_cart(s: Session, user: str) -> str:
+    db.clear_cart(s.require_user(user).id)
+    return "ok"
+
+
+def op_checkout(s: Session, user: str, key: Optional[str] = None) -> str:
+    return f"order_id={db.checkout(s.require_user(user).id, key)}"
+
+
+def op_add_card(s: Session, user: str, name: str, description: str, price_cents: int, stock_qty: int) -> str:
+    s.require_admin(user)
+    return f"id={db.admin_add_card(name, description, price_cents, stock_qty)}"
+
+
+def op_set_price(s: Session, user: str, card_id: int, price_cents: int) -> str:
+    s.require_admin(user)
+    db.admin_update_card_price(card_id, price_cents)
+    return "ok"
+
+
+def op_set_stock(s: Session, user: str, card_id: int, stock_qty: int) -> str:
+    s.require_admin(user)
+    db.admin_update_card_stock(card_id, stock_qty)
+    return "ok"
+
+
+def op_set_active(s: Session, user: str, card_id: int, active: int) -> str:
+    s.require_admin(user)
+    db.admin_set_card_active(card_id, bool(active))
+    return "ok"
+
+
+# op -> (funkcja, parametry po `user` w kolejności z linii tekstowej, ile wymaganych)
+OPS: dict[str, tuple[Callable[..., str], tuple[str, ...], int]] = {
+    "register": (op_register, ("password",), 1),
+    "login": (op_login, ("password",), 1),
+    "add_to_cart": (op_add_to_cart, ("card_id", "qty"), 2),
+    "clear_cart": (op_clear_cart, (), 0),
+    "checkout": (op_checkout, ("key",), 0),
+    "add_card": (op_add_card, ("name", "description", "price_cents", "stock_qty"), 4),
+    "set_price": (op_set_price, ("card_id", "price_cents"), 2),
+    "set_stock": (op_set_stock, ("card_id", "stock_qty"), 2),
+    "set_active": (op_set_active, ("card_id", "active"), 2),
+}
+
+
+def _to_int(value: object) -> Optional[int]:
+    # bool to podklasa int, a int(2.7) obcina - oba odrzucamy zamiast zgadywać
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_line(line_no: int, line: str) -> Optional[Command]:
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    if line.startswith("{"):
+        try:
+            raw = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"linia {line_no}: niepoprawny JSON ({e.msg})") from None
+        if not isinstance(raw, dict):
+            raise ValueError(f"linia {line_no}: oczekiwano obiektu JSON")
+        op = str(raw.pop("op", ""))
+        user = raw.pop("user", None)
+        values = raw
+    else:
+        try:
+            tokens = shlex.split(line)
+        except ValueError as e:
+            raise ValueError(f"linia {line_no}: {e}") from None
+        op, rest = tokens[0], tokens[1:]
+        if op not in OPS:
+            raise ValueError(f"linia {line_no}: nieznane polecenie {op!r}")
+        user = rest[0] if rest else None
+        names = OPS[op][1]
+        if len(rest) - 1 > len(names):
+            raise ValueError(f"linia {line_no}: za dużo argumentów dla {op}")
+        values = dict(zip(names, rest[1:]))
+
+    spec = OPS.get(op)
+    if spec is None:
+        raise ValueError(f"linia {line_no}: nieznane polecenie {op!r}")
+    if not user:
+        raise ValueError(f"linia {line_no}: brak użytkownika dla {op}")
+    if not isinstance(user, str):
+        raise ValueError(f"linia {line_no}: user musi być tekstem")
+    _, names, required = spec
+
+    unknown = set(values) - set(names)
+    if unknown:
+        raise ValueError(f"linia {line_no}: nieznane pola {sorted(unknown)} dla {op}")
+    missing = [name for name in names[:required] if name not in values]
+    if missing:
+        raise ValueError(f"linia {line_no}: brak {', '.join(missing)} dla {op}")
+
+    params = {}
+    for name, value in values.items():
+        if name in INT_PARAMS:
+            value = _to_int(value)
+            if value is None:
+                raise ValueError(f"linia {line_no}: {name} musi być liczbą całkowitą")
+        elif not isinstance(value, str):
+            raise ValueError(f"linia {line_no}: {name} musi być tekstem")
+        params[name] = value
+    return Command(line_no=line_no, op=op, user=user, params=params)
+
+
+def iter_commands(lines: Iterable[str], on_error: Callable[[str], None]) -> Iterator[Command]:
+    # leniwie, linia po linii - strumień (np. stdin) jest wykonywany na bieżąco,
+    # a błędna linia jest zgłaszana i pomijana zamiast przerywać cały przebieg
+    for line_no, line in enumerate(lines, start=1):
+        try:
+            cmd = parse_line(line_no, line)
+        except ValueError as e:
+            on_error(str(e))
+            continue
+        if cmd is not None:
+            yield cmd
+
+
+def execute(session: Session, cmd: Command) -> CommandResult:
+    fn = OPS[cmd.op][0]
+    t0 = time.perf_counter()
+    try:
+        output = fn(session, cmd.user, **cmd.params)
+        ok = True
+    except Exception as e:
+        output = str(e)
+        ok = False
+    return CommandResult(cmd, ok, time.perf_counter() - t0, output)
+
+
+def format_result(res: CommandResult) -> str:
+    status = "OK" if res.ok else "BŁĄD"
+    return (
+        f"[{res.command.line_no}] {res.command.op} {res.command.user} | "
+        f"{status} | {res.latency_s * 1000:.2f} ms | {res.output}"
+    )
+
+
+def run_commands(
+    commands: Iterable[Command],
+    workers: int = 1,
+    on_result: Optional[Callable[[CommandResult], None]] = None,
+) -> list[CommandResult]:
+    if workers < 1:
+        raise ValueError("Liczba workerów musi być >= 1")
+
+    results: list[CommandResult] = []
+    lock = threading.Lock()
+
+    def record(res: CommandResult) -> None:
+        with lock:
+            results.append(res)
+            if on_result is not None:
+                on_result(res)
+
+    if workers == 1:
+        session = Session()
+        for cmd in commands:
+            record(execute(session, cmd))
+        return results
+
+    # podział po użytkowniku wymaga całego wejścia: stały hash (crc32),
+    # żeby przydział był powtarzalny
+    shards: list[list[Command]] = [[] for _ in range(workers)]
+    for cmd in commands:
+        shards[zlib.crc32(cmd.user.encode("utf-8")) % workers].append(cmd)
+
+    def worker(shard: list[Command]) -> None:
+        session = Session()
+        for cmd in shard:
+            record(execute(session, cmd))
+
+    threads = [
+        # kopia kontekstu: worker widzi bazę z config.using wywołującego
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(worker, shard), name=f"batch-{i}"
+        )
+        for i, shard in enumerate(shards)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def print_summary(
+    results: list[CommandResult],
+    wall_s: float,
+    out: TextIO,
+    parse_errors: int = 0,
+) -> None:
+    ok = sum(1 for r in results if r.ok)
+    print("\n=== Podsumowanie ===", file=out)
+    print(
+        f"Polecenia: {len(results)} | OK: {ok} | Błędy: {len(results) - ok} | "
+        f"Błędne linie: {parse_errors} | Czas: {wall_s:.3f} s | {len(results) / wall_s if wall_s > 0 else 0:.1f} pol./s",
+        file=out,
+    )
+    print("Polecenie | Liczba | Błędy | p50 ms | p95 ms | p99 ms | max ms", file=out)
+    by_op: dict[str, list[CommandResult]] = {}
+    for r in results:
+        by_op.setdefault(r.command.op, []).append(r)
+    for op, rs in sorted(by_op.items()):
+        lat = sorted(r.latency_s * 1000 for r in rs)
+        errors = sum(1 for r in rs if not r.ok)
+        print(
+            f"{op} | {len(rs)} | {errors} | {percentile(lat, 50):.2f} | {percentile(lat, 95):.2f} | "
+            f"{percentile(lat, 99):.2f} | {lat[-1]:.2f}",
+            file=out,
+        )
+
+
+def run_script(lines: Iterable[str], workers: int, out: TextIO, quiet: bool = False) -> int:
+    parse_errors: list[str] = []
+
+    def on_error(msg: str) -> None:
+        parse_errors.append(msg)
+        print(f"Błąd skryptu: {msg}", file=out, flush=True)
+
+    def on_result(res: CommandResult) -> None:
+        print(format_result(res), file=out, flush=True)
+
+    t0 = time.perf_counter()
+    results = run_commands(
+        iter_commands(lines, on_error),
+        workers=workers,
+        on_result=None if quiet else on_result,
+    )
+    print_summary(results, time.perf_counter() - t0, out, parse_errors=len(parse_errors))
+    if parse_errors:
+        return 2
+    return 0 if all(r.ok for r in results) else 1
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Union
+from urllib.parse import quote
+
+DEFAULT_DB_PATH = Path(__file__).with_name("shop.db")
+
+# domyślny busy_timeout połączeń (jak w sqlite3); krótszy ustawia tylko
+# database.run_in_transaction, który sam ponawia konflikty blokad
+DEFAULT_BUSY_TIMEOUT_S = 5.0
+
+# SHOP_DB=ścieżka | file:...?... (URI SQLite) | memory:nazwa (współdzielona baza w RAM)
+DB_ENV_VAR = "SHOP_DB"
+MEMORY_PREFIX = "memory:"
+
+
+@dataclass(frozen=True)
+class DbSettings:
+    target: str
+    uri: bool = False
+    path: Optional[Path] = None
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path]) -> DbSettings:
+        p = Path(path)
+        return cls(target=str(p), uri=False, path=p)
+
+    @classmethod
+    def from_uri(cls, uri: str) -> DbSettings:
+        return cls(target=uri, uri=True)
+
+    @classmethod
+    def memory(cls, name: str) -> DbSettings:
+        # baza w RAM współdzielona przez wszystkie połączenia procesu o tej samej nazwie;
+        # istnieje tak długo, jak długo otwarte jest choć jedno połączenie
+        if not name.strip():
+            raise ValueError("Nazwa bazy w pamięci nie może być pusta")
+        return cls(target=f"file:{quote(name.strip(), safe='')}?mode=memory&cache=shared", uri=True)
+
+    @classmethod
+    def parse(cls, raw: str) -> DbSettings:
+        raw = raw.strip()
+        if not raw:
+            raise ValueError("Pusty adres bazy danych")
+        if raw.startswith(MEMORY_PREFIX):
+            return cls.memory(raw[len(MEMORY_PREFIX):])
+        if raw == ":memory:":
+            return cls.memory("shop")
+        if raw.startswith("file:"):
+            return cls.from_uri(raw)
+        return cls.from_path(raw)
+
+    @classmethod
+    def from_env(cls) -> DbSettings:
+        raw = os.environ.get(DB_ENV_VAR)
+        if raw:
+            return cls.parse(raw)
+        return cls.from_path(DEFAULT_DB_PATH)
+
+    def open(self, timeout: float = DEFAULT_BUSY_TIMEOUT_S) -> sqlite3.Connection:
+        return sqlite3.connect(self.target, uri=self.uri, timeout=timeout)
+
+
+# ustawienia procesu (SHOP_DB / configure) oraz nadpisanie w bieżącym
+# kontekście (using) - wątek lub test może pracować na własnej bazie,
+# nie zmieniając jej innym; nowe wątki startują bez nadpisania, chyba że
+# uruchomiono je w kopii kontekstu (contextvars.copy_context)
+_default_settings = DbSettings.from_env()
+_context_settings: ContextVar[Optional[DbSettings]] = ContextVar("shop_db_settings", default=None)
+
+
+def get_settings() -> DbSettings:
+    return _context_settings.get() or _default_settings
+
+
+def _coerce(settings: Union[DbSettings, str, Path]) -> DbSettings:
+    if isinstance(settings, DbSettings):
+        return settings
+    return DbSettings.parse(str(settings))
+
+
+def configure(settings: Union[DbSettings, str, Path]) -> DbSettings:
+    global _default_settings
+    _default_settings = _coerce(settings)
+    return _default_settings
+
+
+@contextmanager
+def using(settings: Union[DbSettings, str, Path]) -> Iterator[DbSettings]:
+    settings = _coerce(settings)
+    token = _context_settings.set(settings)
+    try:
+        yield settings
+    finally:
+        _context_settings.reset(token)
@@ -1,19 +1,115 @@
 import hashlib
+import random
 import sqlite3
+import time
 from dataclasses import dataclass
-from pathlib import Path
-from typing import Iterable, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional, TypeVar, Union
 
-DB_PATH = Path(__file__).with_name("shop.db")
+import config
 
+# odczyty czekają na blokadę config.DEFAULT_BUSY_TIMEOUT_S; transakcje zapisu
+# dostają krótki busy_timeout, a dłuższe oczekiwanie obsługuje
+# run_in_transaction (ponowienia z losowym backoffem aż do deadline'u)
+TX_BUSY_TIMEOUT_S = 0.25
+TX_DEADLINE_S = 10.0
+TX_BACKOFF_BASE_S = 0.01
+TX_BACKOFF_MAX_S = 0.5
 
-def connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# limit parametrów w jednym zapytaniu IN (...) - starsze SQLite mają 999
+SQL_IN_CHUNK = 500
+MAX_PRICE_SERIES_POINTS = 10_000
+
+# format CURRENT_TIMESTAMP w SQLite (UTC, dokładność do sekundy)
+DB_TIMESTAMP_FMT = "%Y-%m-%d %H:%M:%S"
+
+T = TypeVar("T")
+Timestamp = Union[datetime, str]
+
+
+def connect(timeout: float = config.DEFAULT_BUSY_TIMEOUT_S) -> sqlite3.Connection:
+    conn = config.get_settings().open(timeout=timeout)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
 
+def is_lock_error(exc: BaseException) -> bool:
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    msg = str(exc).lower()
+    return "database is locked" in msg or "database is busy" in msg or "database table is locked" in msg
+
+
+def _retry_on_lock(op: Callable[[], T], deadline_s: float) -> T:
+    # konflikty blokad ponawiane z losowym wykładniczym backoffem (full jitter)
+    # aż do deadline'u; wtedy ostatni błąd leci dalej
+    deadline = time.monotonic() + deadline_s
+    attempt = 0
+    while True:
+        try:
+            return op()
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+        attempt += 1
+        backoff = min(TX_BACKOFF_MAX_S, TX_BACKOFF_BASE_S * (2 ** attempt))
+        time.sleep(min(remaining, random.uniform(0, backoff)))
+
+
+def run_in_transaction(
+    work: Callable[[sqlite3.Cursor], T],
+    *,
+    deadline_s: float = TX_DEADLINE_S,
+) -> T:
+    """Wykonuje `work` w transakcji BEGIN IMMEDIATE na nowym połączeniu.
+
+    Konflikty blokad (`database is locked`) są ponawiane z losowym
+    wykładniczym backoffem (full jitter), dopóki nie minie `deadline_s`;
+    wtedy ostatni błąd jest zgłaszany dalej. Pozostałe wyjątki wycofują
+    transakcję i lecą dalej bez ponawiania, więc `work` musi być
+    bezpieczne do ponownego wykonania od zera.
+    """
+
+    def attempt() -> T:
+        conn = connect(timeout=TX_BUSY_TIMEOUT_S)
+        try:
+            # IMMEDIATE bierze blokadę zapisu od razu - unikamy zakleszczenia
+            # przy podnoszeniu blokady odczytu do zapisu w środku transakcji
+            conn.execute("BEGIN IMMEDIATE")
+            result = work(conn.cursor())
+            conn.commit()
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    return _retry_on_lock(attempt, deadline_s)
+
+
+def run_read(
+    work: Callable[[sqlite3.Cursor], T],
+    *,
+    deadline_s: float = TX_DEADLINE_S,
+) -> T:
+    # odczyt z tymi samymi ponowieniami co zapis - potrzebne zwłaszcza dla
+    # współdzielonej bazy w RAM, gdzie busy_timeout nie działa na blokady tabel
+    def attempt() -> T:
+        conn = connect()
+        try:
+            return work(conn.cursor())
+        finally:
+            conn.close()
+
+    return _retry_on_lock(attempt, deadline_s)
+
+
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode("utf-8")).hexdigest()
 
@@ -35,9 +131,19 @@ class Card:
 
 
 def ensure_db_exists() -> None:
-    if not DB_PATH.exists():
+    settings = config.get_settings()
+    if settings.path is not None:
+        exists = settings.path.exists()
+    else:
+        # URI / baza w pamięci - sprawdzamy, czy schemat został utworzony
+        def work(cur: sqlite3.Cursor) -> bool:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cards'")
+            return cur.fetchone() is not None
+
+        exists = run_read(work)
+    if not exists:
         raise FileNotFoundError(
-            f"Brak bazy danych {DB_PATH}. Uruchom najpierw: python setup_db.py"
+            f"Brak bazy danych {settings.target}. Uruchom najpierw: python setup_db.py"
         )
 
 
@@ -49,26 +155,22 @@ def create_user(username: str, password: str, role: str = "user") -> int:
 
     pw_hash = hash_password(password)
 
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> int:
         cur.execute(
             "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
             (username.strip(), pw_hash, role),
         )
         user_id = int(cur.lastrowid)
         cur.execute("INSERT INTO carts (user_id) VALUES (?)", (user_id,))
-        conn.commit()
         return user_id
-    finally:
-        conn.close()
+
+    return run_in_transaction(work)
 
 
 def authenticate(username: str, password: str) -> Optional[User]:
     pw_hash = hash_password(password)
-    conn = connect()
-    try:
-        cur = conn.cursor()
+
+    def work(cur: sqlite3.Cursor) -> Optional[User]:
         cur.execute(
             "SELECT id, username, role FROM users WHERE username = ? AND password_hash = ?",
             (username.strip(), pw_hash),
@@ -77,14 +179,12 @@ def authenticate(username: str, password: str) -> Optional[User]:
         if not row:
             return None
         return User(id=int(row["id"]), username=row["username"], role=row["role"])
-    finally:
-        conn.close()
+
+    return run_read(work)
 
 
 def list_active_cards() -> list[Card]:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> list[Card]:
         cur.execute(
             "SELECT id, name, price_cents, stock_qty, is_active FROM cards WHERE is_active = 1 ORDER BY id"
         )
@@ -99,8 +199,8 @@ def list_active_cards() -> list[Card]:
             )
             for r in rows
         ]
-    finally:
-        conn.close()
+
+    return run_read(work)
 
 
 def admin_add_card(name: str, description: str, price_cents: int, stock_qty: int) -> int:
@@ -111,83 +211,66 @@ def admin_add_card(name: str, description: str, price_cents: int, stock_qty: int
     if stock_qty < 0:
         raise ValueError("Stan nie może być ujemny")
 
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> int:
         cur.execute(
             "INSERT INTO cards (name, description, price_cents, stock_qty, is_active) VALUES (?, ?, ?, ?, 1)",
             (name.strip(), description.strip(), price_cents, stock_qty),
         )
-        conn.commit()
         return int(cur.lastrowid)
-    finally:
-        conn.close()
+
+    return run_in_transaction(work)
 
 
 def admin_update_card_price(card_id: int, new_price_cents: int) -> None:
     if new_price_cents < 0:
         raise ValueError("Cena nie może być ujemna")
 
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> None:
         cur.execute("UPDATE cards SET price_cents = ? WHERE id = ?", (new_price_cents, card_id))
         if cur.rowcount == 0:
             raise ValueError("Nie znaleziono karty")
-        conn.commit()
-    finally:
-        conn.close()
+
+    run_in_transaction(work)
 
 
 def admin_update_card_stock(card_id: int, new_stock_qty: int) -> None:
     #if new_stock_qty < 0:
         #raise ValueError("Stan nie może być ujemny")
 
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> None:
         cur.execute("UPDATE cards SET stock_qty = ? WHERE id = ?", (new_stock_qty, card_id))
         if cur.rowcount == 0:
             raise ValueError("Nie znaleziono karty")
-        conn.commit()
-    finally:
-        conn.close()
+
+    run_in_transaction(work)
 
 
 def admin_set_card_active(card_id: int, is_active: bool) -> None:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> None:
         cur.execute("UPDATE cards SET is_active = ? WHERE id = ?", (1 if is_active else 0, card_id))
         if cur.rowcount == 0:
             raise ValueError("Nie znaleziono karty")
-        conn.commit()
-    finally:
-        conn.close()
+
+    run_in_transaction(work)
 
 
 def get_cart_id(user_id: int) -> int:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> int:
         cur.execute("SELECT id FROM carts WHERE user_id = ?", (user_id,))
         row = cur.fetchone()
         if not row:
             cur.execute("INSERT INTO carts (user_id) VALUES (?)", (user_id,))
-            conn.commit()
             return int(cur.lastrowid)
         return int(row["id"])
-    finally:
-        conn.close()
+
+    return run_in_transaction(work)
 
 
 def add_to_cart(user_id: int, card_id: int, quantity: int) -> None:
     if quantity <= 0:
         raise ValueError("Ilość musi być > 0")
 
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> None:
         cur.execute("SELECT id FROM carts WHERE user_id = ?", (user_id,))
         cart_row = cur.fetchone()
         if not cart_row:
@@ -210,15 +293,12 @@ def add_to_cart(user_id: int, card_id: int, quantity: int) -> None:
             (cart_id, card_id, quantity),
         )
         cur.execute("UPDATE carts SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (cart_id,))
-        conn.commit()
-    finally:
-        conn.close()
+
+    run_in_transaction(work)
 
 
 def get_cart_items(user_id: int) -> list[sqlite3.Row]:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> list[sqlite3.Row]:
         cur.execute(
             "SELECT ci.card_id, c.name, c.price_cents, ci.quantity, (c.price_cents * ci.quantity) AS line_total "
             "FROM carts ca "
@@ -229,14 +309,12 @@ def get_cart_items(user_id: int) -> list[sqlite3.Row]:
             (user_id,),
         )
         return cur.fetchall()
-    finally:
-        conn.close()
+
+    return run_read(work)
 
 
 def clear_cart(user_id: int) -> None:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> None:
         cur.execute("SELECT id FROM carts WHERE user_id = ?", (user_id,))
         row = cur.fetchone()
         if not row:
@@ -244,16 +322,25 @@ def clear_cart(user_id: int) -> None:
         cart_id = int(row["id"])
         cur.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
         cur.execute("UPDATE carts SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (cart_id,))
-        conn.commit()
-    finally:
-        conn.close()
 
+    run_in_transaction(work)
+
+
+def checkout(user_id: int, idempotency_key: Optional[str] = None) -> int:
+    # ten sam klucz idempotencji => to samo zamówienie (bez ponownego zakupu),
+    # np. gdy klient ponawia checkout po timeoucie
+    if idempotency_key is not None and not idempotency_key.strip():
+        raise ValueError("Klucz idempotencji nie może być pusty")
 
-def checkout(user_id: int) -> int:
-    conn = connect()
-    try:
-        cur = conn.cursor()
-        conn.execute("BEGIN")
+    def work(cur: sqlite3.Cursor) -> int:
+        if idempotency_key is not None:
+            cur.execute(
+                "SELECT id FROM orders WHERE user_id = ? AND idempotency_key = ?",
+                (user_id, idempotency_key),
+            )
+            existing = cur.fetchone()
+            if existing:
+                return int(existing["id"])
 
         cur.execute("SELECT id FROM carts WHERE user_id = ?", (user_id,))
         cart_row = cur.fetchone()
@@ -280,8 +367,8 @@ def checkout(user_id: int) -> int:
                 raise ValueError("Brak stanu magazynowego dla jednej z kart")
 
         cur.execute(
-            "INSERT INTO orders (user_id, status, total_cents) VALUES (?, 'paid', 0)",
-            (user_id,),
+            "INSERT INTO orders (user_id, status, total_cents, idempotency_key) VALUES (?, 'paid', 0, ?)",
+            (user_id, idempotency_key),
         )
         order_id = int(cur.lastrowid)
 
@@ -309,47 +396,184 @@ def checkout(user_id: int) -> int:
         cur.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
         cur.execute("UPDATE carts SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (cart_id,))
 
-        conn.commit()
         return order_id
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+
+    return run_in_transaction(work)
 
 
 def list_my_orders(user_id: int) -> list[sqlite3.Row]:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> list[sqlite3.Row]:
         cur.execute(
             "SELECT id, status, total_cents, created_at FROM orders WHERE user_id = ? ORDER BY id DESC",
             (user_id,),
         )
         return cur.fetchall()
-    finally:
-        conn.close()
+
+    return run_read(work)
 
 
 def admin_list_orders() -> list[sqlite3.Row]:
-    conn = connect()
-    try:
-        cur = conn.cursor()
+    def work(cur: sqlite3.Cursor) -> list[sqlite3.Row]:
         cur.execute(
             "SELECT o.id, u.username, o.status, o.total_cents, o.created_at "
             "FROM orders o JOIN users u ON u.id = o.user_id "
             "ORDER BY o.id DESC"
         )
         return cur.fetchall()
-    finally:
-        conn.close()
 
+    return run_read(work)
+
+
+def to_db_timestamp(ts: Timestamp) -> str:
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts.strip())
+        except ValueError:
+            raise ValueError(f"Niepoprawna data: {ts!r}") from None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.strftime(DB_TIMESTAMP_FMT)
+
+
+# każde podzapytanie to pojedynczy seek w idx_price_audit_card_changed
+# (card_id, changed_at, id); cena obowiązująca w chwili ts to:
+# - new_price ostatniej zmiany <= ts, a gdy jej brak
+# - old_price pierwszej zmiany > ts, a gdy jej brak
+# - bieżąca cena karty
+PRICES_AT_SQL = (
+    "SELECT c.id, c.price_cents, c.created_at, "
+    "(SELECT p.new_price_cents FROM price_audit_logs p "
+    " WHERE p.card_id = c.id AND p.changed_at <= ? "
+    " ORDER BY p.changed_at DESC, p.id DESC LIMIT 1) AS price_before, "
+    "(SELECT p.old_price_cents FROM price_audit_logs p "
+    " WHERE p.card_id = c.id AND p.changed_at > ? "
+    " ORDER BY p.changed_at, p.id LIMIT 1) AS price_after "
+    "FROM cards c WHERE c.id IN ({placeholders})"
+)
+
+
+def _price_from_row(row: sqlite3.Row, ts: str) -> Optional[int]:
+    if row["price_before"] is not None:
+        return int(row["price_before"])
+    if row["created_at"] > ts:
+        # karta jeszcze nie istniała
+        return None
+    if row["price_after"] is not None:
+        return int(row["price_after"])
+    return int(row["price_cents"])
+
+
+def _fetch_prices_at(cur: sqlite3.Cursor, card_ids: list[int], ts: str) -> dict[int, Optional[int]]:
+    prices: dict[int, Optional[int]] = {card_id: None for card_id in card_ids}
+    for start in range(0, len(card_ids), SQL_IN_CHUNK):
+        chunk = card_ids[start:start + SQL_IN_CHUNK]
+        cur.execute(
+            PRICES_AT_SQL.format(placeholders=", ".join("?" * len(chunk))),
+            (ts, ts, *chunk),
+        )
+        for row in cur.fetchall():
+            prices[int(row["id"])] = _price_from_row(row, ts)
+    return prices
 
-def admin_seed_defaults() -> None:
-    conn = connect()
-    try:
-        cur = conn.cursor()
 
+def prices_at(card_ids: Iterable[int], ts: Timestamp) -> dict[int, Optional[int]]:
+    # None dla kart nieistniejących (również: jeszcze nieistniejących w chwili ts)
+    ids = list(dict.fromkeys(int(card_id) for card_id in card_ids))
+    if not ids:
+        return {}
+    db_ts = to_db_timestamp(ts)
+    return run_read(lambda cur: _fetch_prices_at(cur, ids, db_ts))
+
+
+def price_at(card_id: int, ts: Timestamp) -> Optional[int]:
+    db_ts = to_db_timestamp(ts)
+
+    def work(cur: sqlite3.Cursor) -> Optional[int]:
+        cur.execute("SELECT 1 FROM cards WHERE id = ?", (card_id,))
+        if not cur.fetchone():
+            raise ValueError("Nie znaleziono karty")
+        return _fetch_prices_at(cur, [card_id], db_ts)[card_id]
+
+    return run_read(work)
+
+
+def price_history(
+    card_id: int,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+) -> list[sqlite3.Row]:
+    sql = "SELECT changed_at, old_price_cents, new_price_cents FROM price_audit_logs WHERE card_id = ?"
+    params: list = [card_id]
+    if start is not None:
+        sql += " AND changed_at >= ?"
+        params.append(to_db_timestamp(start))
+    if end is not None:
+        sql += " AND changed_at <= ?"
+        params.append(to_db_timestamp(end))
+    sql += " ORDER BY changed_at, id"
+
+    def work(cur: sqlite3.Cursor) -> list[sqlite3.Row]:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+    return run_read(work)
+
+
+def price_series(
+    card_id: int,
+    start: Timestamp,
+    end: Timestamp,
+    step_s: int,
+) -> list[tuple[str, Optional[int]]]:
+    # próbkowanie co step_s sekund: cena obowiązująca w każdym punkcie;
+    # jeden seek na cenę początkową + jeden skan zakresu (start, end]
+    if step_s <= 0:
+        raise ValueError("Krok musi być > 0")
+    start_ts = to_db_timestamp(start)
+    end_ts = to_db_timestamp(end)
+    if end_ts < start_ts:
+        raise ValueError("Koniec zakresu przed początkiem")
+    start_dt = datetime.strptime(start_ts, DB_TIMESTAMP_FMT)
+    end_dt = datetime.strptime(end_ts, DB_TIMESTAMP_FMT)
+    points = int((end_dt - start_dt).total_seconds() // step_s) + 1
+    if points > MAX_PRICE_SERIES_POINTS:
+        raise ValueError(f"Za dużo punktów ({points}), zwiększ krok")
+
+    def work(cur: sqlite3.Cursor) -> tuple[sqlite3.Row, Optional[int], list[sqlite3.Row]]:
+        cur.execute("SELECT price_cents, created_at FROM cards WHERE id = ?", (card_id,))
+        card = cur.fetchone()
+        if not card:
+            raise ValueError("Nie znaleziono karty")
+        start_price = _fetch_prices_at(cur, [card_id], start_ts)[card_id]
+        cur.execute(
+            "SELECT changed_at, old_price_cents, new_price_cents FROM price_audit_logs "
+            "WHERE card_id = ? AND changed_at > ? AND changed_at <= ? "
+            "ORDER BY changed_at, id",
+            (card_id, start_ts, end_ts),
+        )
+        return card, start_price, cur.fetchall()
+
+    card, price, changes = run_read(work)
+
+    created_at = card["created_at"]
+    # cena z chwili utworzenia, gdy karta powstała w trakcie zakresu
+    initial_price = int(changes[0]["old_price_cents"]) if changes else int(card["price_cents"])
+
+    series: list[tuple[str, Optional[int]]] = []
+    i = 0
+    for n in range(points):
+        point = (start_dt + timedelta(seconds=n * step_s)).strftime(DB_TIMESTAMP_FMT)
+        while i < len(changes) and changes[i]["changed_at"] <= point:
+            price = int(changes[i]["new_price_cents"])
+            i += 1
+        if price is None and created_at <= point:
+            price = initial_price
+        series.append((point, price))
+    return series
+
+
+def admin_seed_defaults() -> None:
+    def work(cur: sqlite3.Cursor) -> None:
         cur.execute("SELECT COUNT(*) AS cnt FROM users")
         if int(cur.fetchone()["cnt"]) == 0:
             cur.execute(
@@ -374,6 +598,4 @@ def admin_seed_defaults() -> None:
                 ("Karta: Kylian Mbappé", "Edycja limitowana", 2999, 3),
             )
 
-        conn.commit()
-    finally:
-        conn.close()
+    run_in_transaction(work)
@@ -1,9 +1,16 @@
 from __future__ import annotations
 
+import argparse
 import getpass
+import logging
 import sys
+import uuid
+from typing import Optional
 
+import batch
 import database as db
+import setup_db
+from maintenance import MaintenanceScheduler, format_run
 
 
 def fmt_money(cents: int) -> str:
@@ -69,6 +76,10 @@ def login_flow() -> db.User | None:
 
 
 def user_menu(user: db.User) -> None:
+    # jeden klucz na próbę zakupu - ponowienie po błędzie używa tego samego,
+    # więc zakup zapisany mimo zgłoszonego błędu nie wykona się drugi raz
+    checkout_key: str | None = None
+
     while True:
         print("\n=== MENU UŻYTKOWNIKA ===")
         print("1. Przeglądaj karty")
@@ -108,8 +119,11 @@ def user_menu(user: db.User) -> None:
             print(f"Razem: {fmt_money(total)}")
 
         elif choice == "4":
+            if checkout_key is None:
+                checkout_key = uuid.uuid4().hex
             try:
-                order_id = db.checkout(user.id)
+                order_id = db.checkout(user.id, checkout_key)
+                checkout_key = None
                 print(f"OK: zakup zakończony. ID zamówienia: {order_id}")
             except Exception as e:
                 print(f"Błąd checkout: {e}")
@@ -132,7 +146,17 @@ def user_menu(user: db.User) -> None:
             print("Nieznana opcja")
 
 
-def admin_menu(user: db.User) -> None:
+def show_maintenance(maintenance: MaintenanceScheduler) -> None:
+    runs = maintenance.history()
+    if not runs:
+        print("Brak uruchomień konserwacji")
+        return
+    print("\nKonserwacja bazy (ostatnie uruchomienia):")
+    for run in runs[-20:]:
+        print(format_run(run))
+
+
+def admin_menu(user: db.User, maintenance: MaintenanceScheduler) -> None:
     while True:
         print("\n=== PANEL ADMINA ===")
         print("1. Lista kart")
@@ -141,6 +165,7 @@ def admin_menu(user: db.User) -> None:
         print("4. Zmień stan magazynowy")
         print("5. Aktywuj/dezaktywuj kartę")
         print("6. Lista zamówień")
+        print("7. Konserwacja bazy")
         print("0. Wyloguj")
         choice = input("> ").strip()
 
@@ -202,23 +227,16 @@ def admin_menu(user: db.User) -> None:
                     f"{o['id']} | {o['username']} | {o['status']} | {fmt_money(int(o['total_cents']))} | {o['created_at']}"
                 )
 
+        elif choice == "7":
+            show_maintenance(maintenance)
+
         elif choice == "0":
             return
         else:
             print("Nieznana opcja")
 
 
-def main() -> None:
-    try:
-        db.ensure_db_exists()
-    except FileNotFoundError as e:
-        print(e)
-        print("Uruchom: python setup_db.py")
-        return
-
-    # wstaw domyślne dane (admin + kilka kart), jeśli trzeba
-    db.admin_seed_defaults()
-
+def menu_loop(maintenance: MaintenanceScheduler) -> None:
     current_user: db.User | None = None
 
     while True:
@@ -239,7 +257,7 @@ def main() -> None:
             if not current_user:
                 continue
             if current_user.role == "admin":
-                admin_menu(current_user)
+                admin_menu(current_user, maintenance)
             else:
                 user_menu(current_user)
             current_user = None
@@ -256,5 +274,82 @@ def main() -> None:
             print("Nieznana opcja")
 
 
+def parse_args(argv: Optional[list[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Football Card Shop CLI")
+    parser.add_argument(
+        "--script",
+        help="tryb wsadowy: plik z poleceniami (tekst lub JSONL), '-' = stdin",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="liczba równoległych workerów w trybie wsadowym (domyślnie 1)",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="tryb wsadowy: tylko podsumowanie, bez wyniku każdego polecenia",
+    )
+    parser.add_argument(
+        "--log-file",
+        help="plik logu (m.in. każde zadanie konserwacji); bez niego na stderr trafiają tylko błędy",
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers musi być >= 1")
+    return args
+
+
+def run_batch(path: str, workers: int, quiet: bool) -> int:
+    if path == "-":
+        return batch.run_script(sys.stdin, workers, sys.stdout, quiet=quiet)
+    try:
+        f = open(path, encoding="utf-8")
+    except OSError as e:
+        print(f"Nie można otworzyć skryptu: {e}")
+        return 2
+    with f:
+        return batch.run_script(f, workers, sys.stdout, quiet=quiet)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.log_file:
+        logging.basicConfig(
+            filename=args.log_file,
+            level=logging.INFO,
+            format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        )
+    else:
+        logging.basicConfig(level=logging.WARNING)
+
+    try:
+        db.ensure_db_exists()
+    except FileNotFoundError as e:
+        print(e)
+        print("Uruchom: python setup_db.py")
+        return 2
+
+    # baza utworzona starszą wersją: brakujące kolumny (orders.idempotency_key) i indeksy
+    setup_db.upgrade()
+
+    # wstaw domyślne dane (admin + kilka kart), jeśli trzeba
+    db.admin_seed_defaults()
+
+    if args.script:
+        # bez konserwacji w tle - przebieg ma być powtarzalny
+        return run_batch(args.script, args.workers, args.quiet)
+
+    # konserwacja bazy (checkpoint, statystyki, vacuum, stare koszyki) w tle
+    maintenance = MaintenanceScheduler()
+    maintenance.start()
+    try:
+        menu_loop(maintenance)
+    finally:
+        maintenance.stop()
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import database as db
+
+CHECKPOINT_INTERVAL_S = 60.0
+OPTIMIZE_INTERVAL_S = 3600.0
+VACUUM_INTERVAL_S = 600.0
+CART_PURGE_INTERVAL_S = 300.0
+
+# koszyk nieruszany dłużej niż TTL uznajemy za porzucony
+CART_TTL_S = 7 * 24 * 3600
+CART_PURGE_BATCH = 200
+CART_PURGE_MAX_BATCHES = 50
+
+VACUUM_PAGES_PER_RUN = 256
+ANALYSIS_LIMIT = 400
+
+HISTORY_SIZE = 200
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TaskRun:
+    name: str
+    started_at: float
+    duration_s: float
+    affected: int
+    detail: str
+    error: Optional[str] = None
+
+
+@dataclass
+class MaintenanceTask:
+    name: str
+    interval_s: float
+    fn: Callable[[], tuple[int, str]]
+    next_run: float = 0.0
+
+
+def checkpoint_wal() -> tuple[int, str]:
+    conn = db.connect()
+    try:
+        # PASSIVE nie czeka na czytelników ani piszących - nie blokuje zapytań
+        busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        if log_frames == -1:
+            return 0, "baza nie jest w trybie WAL"
+        return int(checkpointed), f"busy={busy} log={log_frames} checkpointed={checkpointed}"
+    finally:
+        conn.close()
+
+
+def optimize_stats() -> tuple[int, str]:
+    conn = db.connect()
+    try:
+        # ogranicza ANALYZE do próbki wierszy na indeks, żeby nie skanować całych tabel
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        before = _stat_rows(conn)
+        if before is None:
+            conn.execute("ANALYZE")
+            action = "ANALYZE (brak statystyk)"
+        else:
+            conn.execute("PRAGMA optimize")
+            action = "PRAGMA optimize"
+        conn.commit()
+        after = _stat_rows(conn) or 0
+        # efekt = liczba wierszy statystyk planera (sqlite_stat1) po zadaniu
+        return after, f"{action}, sqlite_stat1: {before or 0} -> {after} wierszy"
+    finally:
+        conn.close()
+
+
+def _stat_rows(conn: sqlite3.Connection) -> Optional[int]:
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone()
+    if not has_stats:
+        return None
+    return int(conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0])
+
+
+def incremental_vacuum(max_pages: int = VACUUM_PAGES_PER_RUN) -> tuple[int, str]:
+    conn = db.connect()
+    try:
+        mode = int(conn.execute("PRAGMA auto_vacuum").fetchone()[0])
+        if mode != 2:
+            return 0, "auto_vacuum != INCREMENTAL, pominięto"
+        before = int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+        if before == 0:
+            return 0, "brak wolnych stron"
+        # incremental_vacuum zwalnia jedną stronę na krok, a execute() robi tylko
+        # jeden krok - executescript wykonuje pragmę do końca (i zatwierdza)
+        conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        after = int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+        return before - after, f"freelist {before} -> {after}"
+    finally:
+        conn.close()
+
+
+def purge_idle_carts(
+    ttl_s: float = CART_TTL_S,
+    batch_size: int = CART_PURGE_BATCH,
+    max_batches: int = CART_PURGE_MAX_BATCHES,
+) -> tuple[int, str]:
+    # małe partie w osobnych transakcjach - blokada zapisu trzymana krótko;
+    # czyścimy tylko pozycje porzuconych koszyków, a same wiersze carts
+    # zostają (jeden koszyk na użytkownika, checkout widzi pusty koszyk)
+    cutoff = f"-{int(ttl_s)} seconds"
+
+    def work(cur: sqlite3.Cursor) -> tuple[int, int]:
+        cur.execute(
+            "SELECT ca.id FROM carts ca "
+            "WHERE ca.updated_at < datetime('now', ?) "
+            "AND EXISTS (SELECT 1 FROM cart_items ci WHERE ci.cart_id = ca.id) "
+            "LIMIT ?",
+            (cutoff, batch_size),
+        )
+        cart_ids = [int(r["id"]) for r in cur.fetchall()]
+        if not cart_ids:
+            return 0, 0
+        placeholders = ",".join("?" * len(cart_ids))
+        cur.execute(f"DELETE FROM cart_items WHERE cart_id IN ({placeholders})", cart_ids)
+        return len(cart_ids), cur.rowcount
+
+    carts = 0
+    items = 0
+    batches = 0
+    while batches < max_batches:
+        emptied, removed = db.run_in_transaction(work)
+        batches += 1
+        carts += emptied
+        items += removed
+        if emptied < batch_size:
+            break
+    return carts, f"opróżniono {carts} koszyków ({items} pozycji) w {batches} partiach"
+
+
+def default_tasks() -> list[MaintenanceTask]:
+    return [
+        MaintenanceTask("checkpoint", CHECKPOINT_INTERVAL_S, checkpoint_wal),
+        MaintenanceTask("optimize", OPTIMIZE_INTERVAL_S, optimize_stats),
+        MaintenanceTask("incremental_vacuum", VACUUM_INTERVAL_S, incremental_vacuum),
+        MaintenanceTask("purge_idle_carts", CART_PURGE_INTERVAL_S, purge_idle_carts),
+    ]
+
+
+def format_run(run: TaskRun) -> str:
+    status = f"BŁĄD: {run.error}" if run.error else run.detail
+    return f"{run.name}: {run.duration_s * 1000:.1f} ms | zmienione={run.affected} | {status}"
+
+
+class MaintenanceScheduler:
+    def __init__(
+        self,
+        tasks: Optional[list[MaintenanceTask]] = None,
+        history_size: int = HISTORY_SIZE,
+    ) -> None:
+        self.tasks = default_tasks() if tasks is None else tasks
+        self._history: deque[TaskRun] = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_task(self, task: MaintenanceTask) -> TaskRun:
+        started_at = time.time()
+        t0 = time.perf_counter()
+        try:
+            affected, detail = task.fn()
+            run = TaskRun(task.name, started_at, time.perf_counter() - t0, affected, detail)
+        except Exception as e:
+            # błąd jednego zadania nie może zatrzymać pozostałych
+            run = TaskRun(task.name, started_at, time.perf_counter() - t0, 0, "", error=str(e))
+        with self._lock:
+            self._history.append(run)
+        log.log(logging.WARNING if run.error else logging.INFO, "%s", format_run(run))
+        return run
+
+    def run_pending(self, now: Optional[float] = None) -> list[TaskRun]:
+        now = time.monotonic() if now is None else now
+        runs = []
+        for task in self.tasks:
+            if self._stop.is_set():
+                break
+            if task.next_run <= now:
+                runs.append(self.run_task(task))
+                task.next_run = time.monotonic() + task.interval_s
+        return runs
+
+    def history(self) -> list[TaskRun]:
+        with self._lock:
+            return list(self._history)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.run_pending()
+            next_due = min(t.next_run for t in self.tasks)
+            self._stop.wait(max(0.0, next_due - time.monotonic()))
+
+    def start(self) -> None:
+        if self._thread is not None or not self.tasks:
+            return
+        self._stop.clear()
+        now = time.monotonic()
+        # pierwsze uruchomienie po pełnym interwale - start CLI nie czeka na konserwację
+        for task in self.tasks:
+            task.next_run = now + task.interval_s
+        # wątek pracuje na tej samej bazie co wywołujący (także przy config.using)
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._loop,),
+            name="db-maintenance",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def main() -> None:
+    db.ensure_db_exists()
+    scheduler = MaintenanceScheduler()
+    for run in scheduler.run_pending():
+        print(format_run(run))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
 import sqlite3
-from pathlib import Path
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
-DB_PATH = Path(__file__).with_name("shop.db")
+import config
 
 
-def connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+def connect(settings: Optional[config.DbSettings] = None) -> sqlite3.Connection:
+    conn = (settings or config.get_settings()).open()
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
@@ -64,6 +65,7 @@ CREATE TABLE IF NOT EXISTS orders (
     user_id INTEGER NOT NULL,
     status TEXT NOT NULL CHECK(status IN ('created','paid','cancelled')),
     total_cents INTEGER NOT NULL CHECK(total_cents >= 0),
+    idempotency_key TEXT,
     created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
     FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
 );
@@ -81,6 +83,24 @@ CREATE TABLE IF NOT EXISTS order_items (
 """
 
 
+# kolumny dodane po pierwszej wersji schematu - dla istniejących baz
+# (CREATE TABLE IF NOT EXISTS ich nie doda)
+COLUMN_MIGRATIONS = [
+    ("orders", "idempotency_key", "ALTER TABLE orders ADD COLUMN idempotency_key TEXT"),
+]
+
+
+INDEXES_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_user_idempotency_key
+ON orders(user_id, idempotency_key)
+WHERE idempotency_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_carts_updated_at ON carts(updated_at);
+
+CREATE INDEX IF NOT EXISTS idx_price_audit_card_changed ON price_audit_logs(card_id, changed_at);
+"""
+
+
 TRIGGERS_SQL = """
 CREATE TRIGGER IF NOT EXISTS trg_cards_updated_at
 AFTER UPDATE ON cards
@@ -105,18 +125,86 @@ END;
 """
 
 
+def migrate_columns(conn: sqlite3.Connection) -> None:
+    for table, column, ddl in COLUMN_MIGRATIONS:
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(ddl)
+
+
+def upgrade_schema(conn: sqlite3.Connection) -> None:
+    # szybkie, idempotentne uzupełnienie istniejącej bazy (kolumny + indeksy);
+    # wywoływane także przy starcie main.py
+    migrate_columns(conn)
+    conn.executescript(INDEXES_SQL)
+    conn.commit()
+
+
+def upgrade(settings: Optional[config.DbSettings] = None) -> None:
+    conn = connect(settings)
+    try:
+        upgrade_schema(conn)
+    finally:
+        conn.close()
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    # działa tylko dla nowej (pustej) bazy; umożliwia PRAGMA incremental_vacuum
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.executescript(SCHEMA_SQL)
+    upgrade_schema(conn)
+    conn.executescript(TRIGGERS_SQL)
+    conn.commit()
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    # istniejąca baza bez auto_vacuum: zmiana trybu wymaga jednorazowego VACUUM
+    # (przepisuje cały plik - tylko z setup_db, nigdy w trakcie pracy sklepu)
+    if int(conn.execute("PRAGMA auto_vacuum").fetchone()[0]) == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def open_memory_db(name: str) -> sqlite3.Connection:
+    # tworzy schemat we współdzielonej bazie w RAM o danej nazwie; zwrócone
+    # połączenie trzyma bazę przy życiu - zamknięcie jej usuwa. Nie zmienia
+    # bieżącej bazy - do tego służy config.using / memory_db
+    conn = connect(config.DbSettings.memory(name))
+    try:
+        create_schema(conn)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+@contextmanager
+def memory_db(name: str) -> Iterator[config.DbSettings]:
+    # izolowana baza w RAM, bieżąca tylko w tym kontekście (wątku / teście)
+    keep = open_memory_db(name)
+    try:
+        with config.using(config.DbSettings.memory(name)) as settings:
+            yield settings
+    finally:
+        keep.close()
+
+
 def main() -> None:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    settings = config.get_settings()
+    if settings.path is not None:
+        settings.path.parent.mkdir(parents=True, exist_ok=True)
 
-    conn = connect()
+    conn = connect(settings)
     try:
-        conn.executescript(SCHEMA_SQL)
-        conn.executescript(TRIGGERS_SQL)
-        conn.commit()
+        create_schema(conn)
+        if enable_incremental_vacuum(conn):
+            print("OK: włączono auto_vacuum = INCREMENTAL (VACUUM)")
     finally:
         conn.close()
 
-    print(f"OK: utworzono bazę: {DB_PATH}")
+    print(f"OK: utworzono bazę: {settings.target}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,35 @@
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+import database as db  # noqa: E402
+import setup_db  # noqa: E402
+
+
+@pytest.fixture
+def memdb():
+    # osobna baza w RAM na każdy test, z domyślnym adminem i kartami
+    with setup_db.memory_db(f"test_{uuid.uuid4().hex}") as settings:
+        db.admin_seed_defaults()
+        yield settings
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    # baza w pierwotnym schemacie: bez orders.idempotency_key i bez indeksów
+    settings = config.DbSettings.from_path(tmp_path / "shop.db")
+    conn = setup_db.connect(settings)
+    try:
+        conn.executescript(setup_db.SCHEMA_SQL.replace("    idempotency_key TEXT,\n", ""))
+        conn.executescript(setup_db.TRIGGERS_SQL)
+        conn.commit()
+    finally:
+        conn.close()
+    with config.using(settings):
+        db.admin_seed_defaults()
+        yield settings
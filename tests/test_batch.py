@@ -0,0 +1,124 @@
+import io
+
+import pytest
+
+import batch
+import database as db
+
+
+def test_parse_text_line():
+    cmd = batch.parse_line(3, "add_to_cart alice 1 2")
+    assert (cmd.line_no, cmd.op, cmd.user, cmd.params) == (3, "add_to_cart", "alice", {"card_id": 1, "qty": 2})
+
+
+def test_parse_text_line_with_quotes():
+    cmd = batch.parse_line(1, 'add_card admin "Karta X" "opis ze spacją" 999 5')
+    assert cmd.params == {"name": "Karta X", "description": "opis ze spacją", "price_cents": 999, "stock_qty": 5}
+
+
+def test_parse_jsonl_line():
+    cmd = batch.parse_line(1, '{"op": "checkout", "user": "bob", "key": "k1"}')
+    assert (cmd.op, cmd.user, cmd.params) == ("checkout", "bob", {"key": "k1"})
+
+
+def test_parse_optional_param_may_be_omitted():
+    assert batch.parse_line(1, "checkout bob").params == {}
+
+
+@pytest.mark.parametrize("line", ["", "   ", "# komentarz"])
+def test_parse_skips_blank_and_comment_lines(line):
+    assert batch.parse_line(1, line) is None
+
+
+@pytest.mark.parametrize(
+    "line, message",
+    [
+        ("bogus alice", "nieznane polecenie"),
+        ('{"op": "bogus", "user": "a"}', "nieznane polecenie"),
+        ("checkout", "brak użytkownika"),
+        ("add_to_cart alice 1", "brak qty"),
+        ("add_to_cart alice 1 2 3", "za dużo argumentów"),
+        ('{"op": "login", "user": "a", "password": "p", "extra": 1}', "nieznane pola"),
+        ("add_to_cart alice x 2", "card_id musi być liczbą całkowitą"),
+        ('{"op": "add_to_cart", "user": "a", "card_id": 1, "qty": 2.7}', "qty musi być"),
+        ('{"op": "add_to_cart", "user": "a", "card_id": true, "qty": 1}', "card_id musi być"),
+        ('{"op": "login"', "niepoprawny JSON"),
+        ("[1, 2]", "nieznane polecenie"),
+        ('login "alice', "linia 1"),
+        ('{"op": "checkout", "user": "alice", "key": 5}', "key musi być tekstem"),
+        ('{"op": "login", "user": "alice", "password": null}', "password musi być tekstem"),
+        ('{"op": "add_card", "user": "a", "name": ["x"], "description": "d", "price_cents": 1, "stock_qty": 1}',
+         "name musi być tekstem"),
+        ('{"op": "clear_cart", "user": 7}', "user musi być tekstem"),
+    ],
+)
+def test_parse_rejects_invalid_lines(line, message):
+    with pytest.raises(ValueError, match=message):
+        batch.parse_line(1, line)
+
+
+def test_parse_accepts_integral_float():
+    cmd = batch.parse_line(1, '{"op": "add_to_cart", "user": "a", "card_id": 1, "qty": 2.0}')
+    assert cmd.params["qty"] == 2
+
+
+def test_run_script_executes_before_reading_rest_of_stream(memdb):
+    out = io.StringIO()
+    executed_before_next_line = []
+
+    def stream():
+        yield "login admin adminpass\n"
+        yield "set_stock admin 1 9\n"
+        # poprzednie polecenie już wykonane, zanim strumień dał następną linię
+        executed_before_next_line.append(db.list_active_cards()[0].stock_qty)
+        yield "bogus line\n"
+        yield "set_stock admin 1 11\n"
+
+    code = batch.run_script(stream(), workers=1, out=out)
+
+    assert executed_before_next_line == [9]
+    # błędna linia nie przerywa przebiegu
+    assert db.list_active_cards()[0].stock_qty == 11
+    assert code == 2
+    assert "linia 3" in out.getvalue()
+    assert "Błędne linie: 1" in out.getvalue()
+
+
+def test_run_script_counts_non_string_params_as_bad_lines(memdb):
+    out = io.StringIO()
+    code = batch.run_script(['{"op": "checkout", "user": "alice", "key": 5}'], workers=1, out=out)
+    assert code == 2
+    assert "key musi być tekstem" in out.getvalue()
+    assert "Błędne linie: 1" in out.getvalue()
+
+
+def test_run_script_reports_failed_commands(memdb):
+    out = io.StringIO()
+    code = batch.run_script(["add_to_cart nobody 1 1"], workers=1, out=out)
+    assert code == 1
+    assert "nie jest zalogowany" in out.getvalue()
+
+
+def test_admin_commands_require_admin_role(memdb):
+    db.create_user("alice", "secret")
+    results = batch.run_commands(
+        [batch.parse_line(1, "login alice secret"), batch.parse_line(2, "set_price alice 1 1")]
+    )
+    assert [r.ok for r in results] == [True, False]
+    assert results[1].output == "Brak uprawnień administratora"
+
+
+def test_parallel_workers_keep_order_per_user(memdb):
+    lines = []
+    for i in range(8):
+        lines += [f"register u{i} pass{i}", f"login u{i} pass{i}", f"add_to_cart u{i} 2 1", f"checkout u{i} k{i}"]
+        lines.append(f"checkout u{i} k{i}")
+    commands = [batch.parse_line(n, line) for n, line in enumerate(lines, start=1)]
+
+    results = batch.run_commands(commands, workers=4)
+
+    assert len(results) == len(commands)
+    assert all(r.ok for r in results), [batch.format_result(r) for r in results if not r.ok]
+    # workerzy pracowali na bazie testu (kopia kontekstu), powtórzony klucz nie tworzy zamówienia
+    assert len(db.admin_list_orders()) == 8
+    assert db.list_active_cards()[1].stock_qty == 2
@@ -0,0 +1,64 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+import config
+from config import DbSettings
+
+
+def test_parse_file_path(tmp_path):
+    settings = DbSettings.parse(str(tmp_path / "shop.db"))
+    assert settings == DbSettings(target=str(tmp_path / "shop.db"), uri=False, path=tmp_path / "shop.db")
+
+
+def test_parse_file_uri():
+    settings = DbSettings.parse("file:shop.db?mode=ro")
+    assert (settings.target, settings.uri, settings.path) == ("file:shop.db?mode=ro", True, None)
+
+
+def test_parse_named_memory_db():
+    settings = DbSettings.parse("memory:testy")
+    assert settings.target == "file:testy?mode=memory&cache=shared"
+    assert settings.uri and settings.path is None
+
+
+def test_parse_plain_memory_uses_shared_db():
+    assert DbSettings.parse(":memory:") == DbSettings.memory("shop")
+
+
+@pytest.mark.parametrize("raw", ["", "   ", "memory:", "memory:  "])
+def test_parse_rejects_empty_names(raw):
+    with pytest.raises(ValueError):
+        DbSettings.parse(raw)
+
+
+def test_memory_name_is_quoted():
+    settings = DbSettings.memory("a?mode=rw&cache=private")
+    assert settings.target == "file:a%3Fmode%3Drw%26cache%3Dprivate?mode=memory&cache=shared"
+    conn = settings.open()
+    try:
+        # nazwa nie nadpisała parametrów - baza jest w RAM, nie w pliku
+        assert conn.execute("PRAGMA database_list").fetchone()[2] == ""
+    finally:
+        conn.close()
+
+
+def test_using_overrides_only_current_context():
+    default = config.get_settings()
+    seen_in_thread = []
+    with config.using("memory:lokalna") as settings:
+        assert config.get_settings() == settings
+        t = threading.Thread(target=lambda: seen_in_thread.append(config.get_settings()))
+        t.start()
+        t.join()
+    assert seen_in_thread == [default]
+    assert config.get_settings() == default
+
+
+def test_using_restores_previous_settings_on_error():
+    default = config.get_settings()
+    with pytest.raises(RuntimeError):
+        with config.using(Path("inna.db")):
+            raise RuntimeError("boom")
+    assert config.get_settings() == default
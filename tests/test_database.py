@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import config
+import database as db
+import setup_db
+
+
+def test_run_in_transaction_retries_lock_errors(memdb):
+    calls = []
+
+    def work(cur):
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        cur.execute("UPDATE cards SET stock_qty = 42 WHERE id = 1")
+        return "done"
+
+    assert db.run_in_transaction(work) == "done"
+    assert len(calls) == 3
+    assert db.list_active_cards()[0].stock_qty == 42
+
+
+def test_run_in_transaction_gives_up_after_deadline(memdb):
+    calls = []
+
+    def work(cur):
+        calls.append(1)
+        raise sqlite3.OperationalError("database is locked")
+
+    t0 = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        db.run_in_transaction(work, deadline_s=0.2)
+    assert time.monotonic() - t0 < 1.0
+    assert len(calls) > 1
+
+
+def test_run_in_transaction_does_not_retry_other_errors(memdb):
+    calls = []
+
+    def work(cur):
+        calls.append(1)
+        cur.execute("UPDATE cards SET stock_qty = 0 WHERE id = 1")
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        db.run_in_transaction(work)
+    assert len(calls) == 1
+    # zmiana wycofana
+    assert db.list_active_cards()[0].stock_qty == 5
+
+
+def test_write_waits_for_concurrent_lock(tmp_path):
+    settings = config.DbSettings.from_path(tmp_path / "shop.db")
+    conn = setup_db.connect(settings)
+    setup_db.create_schema(conn)
+    conn.close()
+
+    with config.using(settings):
+        db.admin_seed_defaults()
+        locked = threading.Event()
+
+        def hold_lock():
+            other = sqlite3.connect(settings.target, isolation_level=None)
+            other.execute("BEGIN EXCLUSIVE")
+            locked.set()
+            time.sleep(0.5)
+            other.execute("COMMIT")
+            other.close()
+
+        t = threading.Thread(target=hold_lock)
+        t.start()
+        locked.wait()
+        # dłużej niż TX_BUSY_TIMEOUT_S - przechodzi dzięki ponowieniom
+        db.admin_update_card_stock(1, 7)
+        # odczyt czeka na blokadę (domyślny busy_timeout), a nie zgłasza błąd
+        assert db.authenticate("admin", "adminpass") is not None
+        t.join()
+        assert db.list_active_cards()[0].stock_qty == 7
+
+
+def test_read_retries_table_lock_in_shared_memory_db(memdb):
+    locked = threading.Event()
+
+    def hold_lock():
+        # shared cache: blokada tabeli users od razu zgłasza błąd czytelnikom,
+        # busy_timeout tu nie pomaga
+        other = memdb.open()
+        other.isolation_level = None
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("UPDATE users SET role = role WHERE username = 'admin'")
+        locked.set()
+        time.sleep(0.3)
+        other.execute("COMMIT")
+        other.close()
+
+    t = threading.Thread(target=hold_lock)
+    t.start()
+    locked.wait()
+    try:
+        user = db.authenticate("admin", "adminpass")
+    finally:
+        t.join()
+    assert user is not None and user.role == "admin"
+
+
+def test_read_gives_up_after_deadline(memdb):
+    calls = []
+
+    def work(cur):
+        calls.append(1)
+        raise sqlite3.OperationalError("database table is locked: users")
+
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        db.run_read(work, deadline_s=0.2)
+    assert len(calls) > 1
+
+
+def test_checkout_with_same_key_returns_original_order(memdb):
+    user_id = db.create_user("alice", "secret")
+    db.add_to_cart(user_id, 1, 2)
+
+    order_id = db.checkout(user_id, "key-1")
+    assert db.checkout(user_id, "key-1") == order_id
+    assert len(db.list_my_orders(user_id)) == 1
+    # stan zmniejszony tylko raz
+    assert db.list_active_cards()[0].stock_qty == 3
+
+
+def test_checkout_key_is_scoped_per_user(memdb):
+    alice = db.create_user("alice", "secret")
+    bob = db.create_user("bob", "secret")
+    db.add_to_cart(alice, 1, 1)
+    db.add_to_cart(bob, 1, 1)
+
+    assert db.checkout(alice, "same") != db.checkout(bob, "same")
+
+
+def test_failed_checkout_does_not_consume_key(memdb):
+    user_id = db.create_user("alice", "secret")
+    with pytest.raises(ValueError, match="pusty"):
+        db.checkout(user_id, "key-1")
+
+    db.add_to_cart(user_id, 1, 1)
+    order_id = db.checkout(user_id, "key-1")
+    assert [int(o["id"]) for o in db.list_my_orders(user_id)] == [order_id]
+
+
+def test_checkout_rejects_blank_key(memdb):
+    user_id = db.create_user("alice", "secret")
+    with pytest.raises(ValueError):
+        db.checkout(user_id, "  ")
+
+
+def test_upgrade_adds_idempotency_key_to_legacy_database(legacy_db):
+    user_id = db.create_user("alice", "secret")
+    db.add_to_cart(user_id, 1, 1)
+    with pytest.raises(sqlite3.OperationalError, match="idempotency_key"):
+        db.checkout(user_id)
+
+    setup_db.upgrade()
+    setup_db.upgrade()  # idempotentne
+
+    order_id = db.checkout(user_id, "key-1")
+    assert db.checkout(user_id, "key-1") == order_id
@@ -0,0 +1,125 @@
+import pytest
+
+import database as db
+import maintenance
+from maintenance import MaintenanceScheduler, MaintenanceTask
+
+
+def make_idle_carts(count, age="-2 days"):
+    # `count` użytkowników z jedną pozycją w koszyku, koszyki nieruszane od `age`
+    user_ids = []
+    for i in range(count):
+        user_id = db.create_user(f"idle{i}", "haslo123")
+        db.add_to_cart(user_id, 1, 1)
+        user_ids.append(user_id)
+    conn = db.connect()
+    try:
+        conn.execute(
+            f"UPDATE carts SET updated_at = datetime('now', ?) "
+            f"WHERE user_id IN ({','.join('?' * len(user_ids))})",
+            [age, *user_ids],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return user_ids
+
+
+def count(sql):
+    conn = db.connect()
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_purge_empties_only_carts_older_than_ttl(memdb):
+    idle = make_idle_carts(2)
+    fresh = db.create_user("fresh", "haslo123")
+    db.add_to_cart(fresh, 1, 1)
+    carts_before = count("SELECT COUNT(*) FROM carts")
+
+    affected, _ = maintenance.purge_idle_carts(ttl_s=24 * 3600)
+
+    assert affected == 2
+    assert all(db.get_cart_items(u) == [] for u in idle)
+    assert len(db.get_cart_items(fresh)) == 1
+    # wiersze carts zostają - jeden koszyk na użytkownika
+    assert count("SELECT COUNT(*) FROM carts") == carts_before
+
+
+def test_purge_keeps_checkout_error_for_emptied_cart(memdb):
+    (user_id,) = make_idle_carts(1)
+    maintenance.purge_idle_carts(ttl_s=3600)
+    with pytest.raises(ValueError, match="Koszyk jest pusty"):
+        db.checkout(user_id)
+
+
+def test_purge_works_in_batches(memdb):
+    make_idle_carts(5)
+    affected, detail = maintenance.purge_idle_carts(ttl_s=3600, batch_size=2)
+    assert affected == 5
+    assert "w 3 partiach" in detail
+    assert count("SELECT COUNT(*) FROM cart_items") == 0
+
+
+def test_purge_stops_after_max_batches(memdb):
+    make_idle_carts(5)
+    affected, detail = maintenance.purge_idle_carts(ttl_s=3600, batch_size=2, max_batches=2)
+    assert affected == 4
+    assert "w 2 partiach" in detail
+    assert count("SELECT COUNT(*) FROM cart_items") == 1
+
+
+def test_run_task_records_error_in_history():
+    def broken():
+        raise RuntimeError("boom")
+
+    scheduler = MaintenanceScheduler(tasks=[MaintenanceTask("broken", 60, broken)])
+    run = scheduler.run_task(scheduler.tasks[0])
+
+    assert run.error == "boom"
+    assert run.affected == 0
+    assert scheduler.history() == [run]
+    assert "BŁĄD: boom" in maintenance.format_run(run)
+
+
+def test_run_pending_runs_due_tasks_and_reschedules():
+    calls = []
+    due = MaintenanceTask("due", 60, lambda: calls.append("due") or (1, "ok"), next_run=0.0)
+    later = MaintenanceTask("later", 60, lambda: calls.append("later") or (1, "ok"), next_run=1e12)
+    scheduler = MaintenanceScheduler(tasks=[due, later])
+
+    runs = scheduler.run_pending(now=100.0)
+
+    assert calls == ["due"]
+    assert [r.name for r in runs] == ["due"]
+    assert due.next_run > 100.0
+    assert later.next_run == 1e12
+    # zadanie nie jest powtarzane przed upływem interwału
+    assert scheduler.run_pending(now=due.next_run - 1) == []
+    assert [r.name for r in scheduler.run_pending(now=due.next_run)] == ["due"]
+
+
+def test_incremental_vacuum_shrinks_freelist(memdb):
+    conn = db.connect()
+    try:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        conn.execute("CREATE TABLE filler (data BLOB)")
+        conn.executemany("INSERT INTO filler VALUES (?)", [(b"x" * 4000,) for _ in range(200)])
+        conn.commit()
+        conn.execute("DROP TABLE filler")
+        conn.commit()
+        freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    assert freed > 10
+
+    affected, detail = maintenance.incremental_vacuum(max_pages=10)
+    assert affected == 10
+    assert count("PRAGMA freelist_count") == freed - 10
+
+    affected, _ = maintenance.incremental_vacuum()
+    assert affected == freed - 10
+    assert count("PRAGMA freelist_count") == 0
+    assert maintenance.incremental_vacuum() == (0, "brak wolnych stron")
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import database as db
+import setup_db
+
+
+@pytest.fixture
+def price_log(memdb):
+    # karta 1: 1999 od 2026-01-01, 2100 od 02-01, 2300 od 03-01 (dwie zmiany w tej samej sekundzie)
+    conn = db.connect()
+    try:
+        conn.execute("UPDATE cards SET created_at = '2026-01-01 00:00:00'")
+        conn.executemany(
+            "INSERT INTO price_audit_logs (card_id, old_price_cents, new_price_cents, changed_at) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (1, 1999, 2100, "2026-02-01 00:00:00"),
+                (1, 2100, 2200, "2026-03-01 00:00:00"),
+                (1, 2200, 2300, "2026-03-01 00:00:00"),
+            ],
+        )
+        conn.execute(
+            "INSERT INTO cards (name, price_cents, stock_qty, created_at) "
+            "VALUES ('Nowa', 500, 1, '2026-02-15 00:00:00')"
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return memdb
+
+
+def test_price_at_uses_last_change_before_timestamp(price_log):
+    assert db.price_at(1, "2026-02-01 00:00:00") == 2100
+    assert db.price_at(1, "2026-02-20") == 2100
+    assert db.price_at(1, "2026-03-05") == 2300
+
+
+def test_price_at_before_first_change_uses_old_price(price_log):
+    assert db.price_at(1, "2026-01-15") == 1999
+
+
+def test_price_at_without_changes_uses_current_price(price_log):
+    assert db.price_at(2, "2026-06-01") == 1499
+
+
+def test_price_at_before_card_existed_is_none(price_log):
+    assert db.price_at(1, "2025-12-31 23:59:59") is None
+
+
+def test_price_at_unknown_card(price_log):
+    with pytest.raises(ValueError):
+        db.price_at(999, "2026-01-01")
+
+
+def test_price_at_accepts_aware_datetime(price_log):
+    ts = datetime(2026, 2, 1, 1, 0, tzinfo=timezone(timedelta(hours=2)))  # 2026-01-31 23:00 UTC
+    assert db.price_at(1, ts) == 1999
+
+
+def test_prices_at_bulk(price_log):
+    assert db.prices_at([1, 2, 4, 999, 1], "2026-02-10") == {1: 2100, 2: 1499, 4: None, 999: None}
+    assert db.prices_at([], "2026-02-10") == {}
+
+
+def test_price_history_range(price_log):
+    rows = db.price_history(1, start="2026-02-15")
+    assert [(r["old_price_cents"], r["new_price_cents"]) for r in rows] == [(2100, 2200), (2200, 2300)]
+
+
+def test_price_series_samples_price_in_effect(price_log):
+    series = db.price_series(1, "2026-01-20", "2026-03-10", 10 * 86400)
+    assert series == [
+        ("2026-01-20 00:00:00", 1999),
+        ("2026-01-30 00:00:00", 1999),
+        ("2026-02-09 00:00:00", 2100),
+        ("2026-02-19 00:00:00", 2100),
+        ("2026-03-01 00:00:00", 2300),
+    ]
+
+
+def test_price_series_card_created_mid_range(price_log):
+    series = db.price_series(4, "2026-02-01", "2026-03-10", 10 * 86400)
+    assert [price for _, price in series] == [None, None, 500, 500]
+
+
+def test_price_series_card_created_mid_range_with_later_change(price_log):
+    conn = db.connect()
+    try:
+        conn.execute(
+            "INSERT INTO price_audit_logs (card_id, old_price_cents, new_price_cents, changed_at) "
+            "VALUES (4, 500, 700, '2026-03-01 00:00:00')"
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    db.admin_update_card_price(4, 700)
+
+    series = db.price_series(4, "2026-02-01", "2026-03-10", 10 * 86400)
+    # przed pierwszą zmianą obowiązuje jej old_price, nie bieżąca cena
+    assert [price for _, price in series] == [None, None, 500, 700]
+
+
+def test_price_series_rejects_too_many_points(price_log):
+    with pytest.raises(ValueError):
+        db.price_series(1, "2026-01-01", "2026-12-31", 1)
+
+
+def test_upgrade_creates_price_index_used_by_point_in_time_query(legacy_db):
+    def plan():
+        conn = db.connect()
+        try:
+            rows = conn.execute(
+                "EXPLAIN QUERY PLAN " + db.PRICES_AT_SQL.format(placeholders="?"),
+                ("2026-02-01 00:00:00", "2026-02-01 00:00:00", 1),
+            ).fetchall()
+            return " | ".join(row["detail"] for row in rows)
+        finally:
+            conn.close()
+
+    assert "idx_price_audit_card_changed" not in plan()
+
+    setup_db.upgrade()
+
+    conn = db.connect()
+    try:
+        indexes = {r["name"] for r in conn.execute("PRAGMA index_list(price_audit_logs)")}
+    finally:
+        conn.close()
+    assert "idx_price_audit_card_changed" in indexes
+    assert "idx_price_audit_card_changed" in plan()
+    assert db.price_at(1, "2026-12-31") == 1999